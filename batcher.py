@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+import anyio
+
+from worker_pool import WorkerError
+
+logger = logging.getLogger("plane_detection_api")
+
+
+class DynamicBatcher:
+    """Coalesces concurrent same-shape detection requests into worker batches.
+
+    Requests are grouped by ``(width, height, params)``. Whatever is queued
+    for a group is sent to a single worker as one batch; when every worker is
+    busy, the batch is held back for up to ``max_delay`` seconds to let more
+    requests join it.
+    """
+
+    def __init__(self, pool, max_batch_size=8, max_delay=0.02, max_in_flight=16):
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._limiter = anyio.CapacityLimiter(max_in_flight)
+        self._queues = {}
+        self._tasks = set()
+
+    async def detect(self, width, height, params, segment):
+        """Queue the point cloud in ``segment`` and return its binary plane list."""
+        key = (width, height, params)
+        future = asyncio.get_running_loop().create_future()
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = asyncio.Queue()
+            self._spawn(self._collect(key, queue))
+        queue.put_nowait((segment, future))
+
+        return await future
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _collect(self, key, queue):
+        loop = asyncio.get_running_loop()
+        try:
+            while not queue.empty():
+                batch = [queue.get_nowait()]
+                while len(batch) < self.max_batch_size and not queue.empty():
+                    batch.append(queue.get_nowait())
+
+                # Nothing would pick the batch up right now anyway, so give
+                # other requests a chance to join it
+                if not self.pool.idle:
+                    deadline = loop.time() + self.max_delay
+                    while len(batch) < self.max_batch_size:
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            batch.append(await asyncio.wait_for(queue.get(), timeout))
+                        except asyncio.TimeoutError:
+                            break
+
+                self._spawn(self._dispatch(key, batch))
+        finally:
+            # Idle groups are dropped; the next request for the key starts a
+            # new collector
+            del self._queues[key]
+
+    async def _dispatch(self, key, batch):
+        width, height, params = key
+        async with self._limiter:
+            try:
+                worker = await self.pool.acquire()
+                try:
+                    results = await worker.detect_batch(width, height, params, [segment for segment, _ in batch])
+                finally:
+                    self.pool.release(worker)
+            except Exception as e:
+                results = [e] * len(batch)
+
+        if len(batch) > 1:
+            logger.info(f"Processed batch of {len(batch)} point clouds ({width}x{height})")
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
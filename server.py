@@ -1,13 +1,25 @@
 import os
-import json
-import subprocess
+import asyncio
+import hashlib
 import logging
+import struct
+from functools import lru_cache
+from contextlib import asynccontextmanager
 from typing import List
 
-from fastapi import FastAPI, HTTPException, Query, Request
+import lz4.frame
+import orjson
+from cachetools import LRUCache
+from anyio import to_thread
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel
 
+from batcher import DynamicBatcher
+import worker_pool
+from worker_pool import HEADER, PLANE_COUNT, SegmentPool, Worker, WorkerError, WorkerPool, decode_planes
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,8 +35,91 @@ class Plane(BaseModel):
     distanceFromOrigin: float
     inlierCount: int
 
+# Set up logger
+logger = logging.getLogger("plane_detection_api")
+
+# Path to the C++ executable
+EXECUTABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "stdin_planes")
+logger.info(f"C++ executable path: {EXECUTABLE_PATH}")
+
+# CPU pinning, off by default: a pinned worker only runs as many OpenMP
+# threads as it has CPUs, which with one worker per core makes a lone request
+# single-threaded. With PLANES_PIN_WORKERS=1, the C++ workers are pinned to
+# disjoint slices of the CPUs the server may run on. PLANES_SERVER_CPUS=N
+# also pins them, and keeps the first N CPUs for the Python side (event loop,
+# request parsing). Without sched_getaffinity (non-Linux), nothing is pinned
+ALLOWED_CPUS = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+PIN_WORKERS = bool(int(os.environ.get("PLANES_PIN_WORKERS", "0")))
+SERVER_CPU_COUNT = int(os.environ.get("PLANES_SERVER_CPUS", "0"))
+if 0 < SERVER_CPU_COUNT < len(ALLOWED_CPUS):
+    SERVER_CPUS, WORKER_CPUS = ALLOWED_CPUS[:SERVER_CPU_COUNT], ALLOWED_CPUS[SERVER_CPU_COUNT:]
+elif PIN_WORKERS:
+    SERVER_CPUS, WORKER_CPUS = None, ALLOWED_CPUS or None
+else:
+    SERVER_CPUS, WORKER_CPUS = None, None
+
+# Number of uvicorn worker processes serving the app (set by the prod
+# entrypoint below), and of persistent C++ worker processes in each of them.
+# By default the workers' cores are split between the uvicorn workers' pools,
+# so the total in-flight native compute matches the core count
+UVICORN_WORKERS = int(os.environ.get("PLANES_UVICORN_WORKERS", "1"))
+WORKER_CPU_COUNT = len(WORKER_CPUS) if WORKER_CPUS else os.cpu_count() or 1
+WORKER_POOL_SIZE = int(os.environ.get("PLANES_POOL_SIZE", max(1, WORKER_CPU_COUNT // UVICORN_WORKERS)))
+
+# Whether the C++ workers print their diagnostics to stderr: with
+# PLANES_WORKER_DEBUG=1, or when debug logging is enabled
+WORKER_DEBUG = bool(int(os.environ.get("PLANES_WORKER_DEBUG", "0"))) or logger.isEnabledFor(logging.DEBUG)
+
+# Pool of long-lived C++ workers, started with the app. Pools of different
+# uvicorn workers partition the same CPUs, so with the default sizes each
+# slice is shared by one C++ worker per uvicorn worker
+pool = WorkerPool(EXECUTABLE_PATH, WORKER_POOL_SIZE, quiet=not WORKER_DEBUG, cpus=WORKER_CPUS)
+
+# Reusable shared memory segments for inbound point clouds. Idle segments
+# stay in /dev/shm, so they are capped at PLANES_SEGMENT_CACHE_BYTES in total
+SEGMENT_CACHE_BYTES = int(os.environ.get("PLANES_SEGMENT_CACHE_BYTES", 1 << 27))
+segments = SegmentPool(max_segments=2 * WORKER_POOL_SIZE, max_bytes=SEGMENT_CACHE_BYTES)
+
+# Coalesces concurrent same-shape requests into one worker call
+batcher = DynamicBatcher(pool, max_batch_size=8, max_delay=0.02)
+
+# Worker output for small point clouds (e.g. repeated test pings), which is
+# deterministic for given points and parameters. Larger clouds are unlikely
+# to repeat and not worth hashing
+RESPONSE_CACHE_MAX_BYTES = 1 << 16
+response_cache = LRUCache(maxsize=1024)
+
+# Largest point cloud accepted, in points, as its shared memory segment is
+# allocated before the body is read
+MAX_POINTS = int(os.environ.get("PLANES_MAX_POINTS", 1 << 24))
+
+# Binary plane list of an empty grid
+NO_PLANES = PLANE_COUNT.pack(0)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Size the threadpool used for any sync work (e.g. sync dependencies) to
+    # the cores, so it can't crowd out the event loop or the C++ workers
+    to_thread.current_default_thread_limiter().total_tokens = os.cpu_count() or 1
+    
+    # The executable can't appear or vanish between requests, so check it once
+    # and refuse to start without it
+    if not os.path.isfile(EXECUTABLE_PATH):
+        raise RuntimeError(f"C++ executable not found at {EXECUTABLE_PATH}. Make sure to build the project first.")
+    await pool.start()
+    if SERVER_CPUS:
+        # Applies to the event loop thread, any thread it starts later and
+        # any process it spawns, so every C++ worker must be given its CPUs
+        os.sched_setaffinity(0, SERVER_CPUS)
+        logger.info(f"Server pinned to CPUs {SERVER_CPUS}")
+    try:
+        yield
+    finally:
+        await pool.close()
+        segments.close()
+
 # Create FastAPI app
-app = FastAPI(title="Plane Detection API")
+app = FastAPI(title="Plane Detection API", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -35,150 +130,328 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Set up logger
-logger = logging.getLogger("plane_detection_api")
-
-# Path to the C++ executable
-EXECUTABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "stdin_planes")
-logger.info(f"C++ executable path: {EXECUTABLE_PATH}")
-
 @app.get("/")
 async def read_root():
     return {"message": "Plane Detection API is running"}
 
-@app.post("/planes", response_model=List[Plane])
+# Largest value of the worker header's u32 fields, and (rounded down) of its
+# f32 fields
+U32_MAX = 2**32 - 1
+F32_MAX = 3.4e38
+
+@lru_cache(maxsize=256)
+def worker_params(min_normal_diff, max_dist, outlier_ratio, min_num_points, nr_neighbors, max_planes):
+    # Parameter fields and flags for the worker header; parameters missing
+    # from the query string are left unflagged so the C++ defaults apply.
+    # The cached tuple doubles as part of the batching key
+    flags = 0
+    if min_normal_diff is not None:
+        flags |= worker_pool.MIN_NORMAL_DIFF
+    if max_dist is not None:
+        flags |= worker_pool.MAX_DIST
+    if outlier_ratio is not None:
+        flags |= worker_pool.OUTLIER_RATIO
+    if min_num_points is not None:
+        flags |= worker_pool.MIN_NUM_POINTS
+    if nr_neighbors is not None:
+        flags |= worker_pool.NR_NEIGHBORS
+    if max_planes is not None and max_planes > 0:
+        flags |= worker_pool.MAX_PLANES
+    return (
+        min_normal_diff or 0.0,
+        max_dist or 0.0,
+        outlier_ratio or 0.0,
+        min_num_points or 0,
+        nr_neighbors or 0,
+        max(max_planes or 0, 0),
+        flags,
+    )
+
+async def read_body_into(request, buf, expected_bytes):
+    # Bodies sent with "Content-Encoding: lz4" are LZ4 frames, decompressed on
+    # the fly as chunks arrive
+    compressed = request.headers.get("content-encoding") == "lz4"
+    decompressor = lz4.frame.LZ4FrameDecompressor() if compressed else None
+    
+    # Copy the body chunk by chunk, rejecting it as soon as it overruns
+    data_size = 0
+    async for chunk in request.stream():
+        if decompressor is not None and chunk:
+            if decompressor.eof:
+                raise HTTPException(status_code=400, detail="Invalid LZ4 data: trailing data after the end of the frame")
+            try:
+                # Inflate at most one byte more than still fits, which is
+                # enough to detect an overrun
+                chunk = decompressor.decompress(chunk, max_length=expected_bytes - data_size + 1)
+            except RuntimeError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid LZ4 data: {e}")
+            if decompressor.unused_data:
+                raise HTTPException(status_code=400, detail="Invalid LZ4 data: trailing data after the end of the frame")
+        chunk_size = len(chunk)
+        if data_size + chunk_size > expected_bytes:
+            logger.error(f"Binary data size mismatch: got more than {expected_bytes} bytes")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Binary data size mismatch: got more than {expected_bytes} bytes, expected {expected_bytes} bytes"
+            )
+        buf[data_size:data_size + chunk_size] = chunk
+        data_size += chunk_size
+    if decompressor is not None and not decompressor.eof:
+        raise HTTPException(status_code=400, detail="Invalid LZ4 data: truncated frame")
+    logger.info(f"Received binary data: {data_size} bytes")
+    
+    if data_size != expected_bytes:
+        logger.error(f"Binary data size mismatch: got {data_size} bytes, expected {expected_bytes} bytes")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Binary data size mismatch: got {data_size} bytes, expected {expected_bytes} bytes"
+        )
+
+def json_response(content):
+    # Serialized with orjson directly; FastAPI's ORJSONResponse is deprecated
+    return Response(content=orjson.dumps(content), media_type="application/json")
+
+def response_cache_key(width, height, params, data):
+    # blake2b keyed with the worker header, so identical points with other
+    # parameters or grid shapes get other keys. This is only a cache key,
+    # not a security boundary
+    return hashlib.blake2b(data, digest_size=16, key=HEADER.pack(width, height, *params, 0)).digest()
+
+# The body may be LZ4-compressed (lz4.frame format) if sent with
+# "Content-Encoding: lz4". Clients sending "Accept: application/octet-stream"
+# get the worker's packed plane records as-is (a little-endian u32 count, then
+# per plane 12 f32 for normal, center, basisU and basisV, an f32
+# distanceFromOrigin and a u32 inlierCount) instead of JSON. The worker output
+# is well-formed by construction, so it is not validated against Plane on the
+# way out; the model only documents the response.
+@app.post(
+    "/planes",
+    responses={200: {"model": List[Plane], "content": {"application/octet-stream": {}}}}
+)
 async def detect_planes(
     request: Request,
-    width: int = Query(..., description="Width of the point cloud grid"),
-    height: int = Query(..., description="Height of the point cloud grid"),
-    min_normal_diff: float = Query(None, description="Minimum normal difference in degrees (default: 60)"),
-    max_dist: float = Query(None, description="Maximum distance in degrees (default: 75)"),
-    outlier_ratio: float = Query(None, description="Maximum outlier ratio (default: 0.75)"),
-    min_num_points: int = Query(None, description="Minimum number of points (default: 30)"),
-    nr_neighbors: int = Query(None, description="Number of neighbors for KNN (default: 75)"),
-    max_planes: int = Query(None, description="Maximum number of planes to return")
+    width: int = Query(..., ge=0, le=U32_MAX, description="Width of the point cloud grid"),
+    height: int = Query(..., ge=0, le=U32_MAX, description="Height of the point cloud grid"),
+    min_normal_diff: float = Query(None, ge=-F32_MAX, le=F32_MAX, description="Minimum normal difference in degrees (default: 60)"),
+    max_dist: float = Query(None, ge=-F32_MAX, le=F32_MAX, description="Maximum distance in degrees (default: 75)"),
+    outlier_ratio: float = Query(None, ge=-F32_MAX, le=F32_MAX, description="Maximum outlier ratio (default: 0.75)"),
+    min_num_points: int = Query(None, ge=0, le=U32_MAX, description="Minimum number of points (default: 30)"),
+    nr_neighbors: int = Query(None, ge=0, le=U32_MAX, description="Number of neighbors for KNN (default: 75)"),
+    max_planes: int = Query(None, le=U32_MAX, description="Maximum number of planes to return")
 ):
     logger.info(f"Received plane detection request: width={width}, height={height}")
     
-    # Get raw query parameters to check which ones were actually provided
-    query_params = dict(request.query_params)
-    param_provided = {
-        "min_normal_diff": "min_normal_diff" in query_params,
-        "max_dist": "max_dist" in query_params,
-        "outlier_ratio": "outlier_ratio" in query_params,
-        "min_num_points": "min_num_points" in query_params,
-        "nr_neighbors": "nr_neighbors" in query_params,
-        "max_planes": "max_planes" in query_params
-    }
-    
     # Log which parameters were provided
-    for param, provided in param_provided.items():
-        if provided:
+    if logger.isEnabledFor(logging.DEBUG):
+        for param in ("min_normal_diff", "max_dist", "outlier_ratio", "min_num_points", "nr_neighbors", "max_planes"):
             value = locals()[param]
-            logger.info(f"Parameter provided: {param}={value}")
+            if value is not None:
+                logger.debug(f"Parameter provided: {param}={value}")
     
-    # Read raw binary data from request
-    binary_data = await request.body()
-    data_size = len(binary_data)
-    logger.info(f"Received binary data: {data_size} bytes")
+    binary = "application/octet-stream" in request.headers.get("accept", "")
     
-    # Expected size: 4 bytes (f32) * 3 coordinates * width * height
-    expected_bytes = 4 * 3 * width * height
-    if data_size != expected_bytes:
-        logger.error(f"Binary data size mismatch: got {data_size} bytes, expected {expected_bytes} bytes")
+    # An empty grid has no planes, no need to involve a worker
+    if width == 0 or height == 0:
+        if binary:
+            return Response(content=NO_PLANES, media_type="application/octet-stream")
+        return json_response([])
+    
+    if width * height > MAX_POINTS:
         raise HTTPException(
-            status_code=400,
-            detail=f"Binary data size mismatch: got {data_size} bytes, expected {expected_bytes} bytes"
+            status_code=413,
+            detail=f"Point cloud too large: {width * height} points, at most {MAX_POINTS} are accepted"
         )
     
-    # Check if executable exists
-    if not os.path.exists(EXECUTABLE_PATH):
+    # Expected size: 4 bytes (f32) * 3 coordinates * width * height
+    expected_bytes = 4 * 3 * width * height
+    
+    # Reject uncompressed bodies of the wrong size before allocating for them
+    content_length = request.headers.get("content-length")
+    if request.headers.get("content-encoding") != "lz4" and content_length is not None and content_length.isdigit():
+        if int(content_length) != expected_bytes:
+            logger.error(f"Binary data size mismatch: got {content_length} bytes, expected {expected_bytes} bytes")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Binary data size mismatch: got {content_length} bytes, expected {expected_bytes} bytes"
+            )
+    
+    # Points go to the C++ worker through a shared memory segment; the body is
+    # streamed straight into it
+    try:
+        segment = segments.acquire(expected_bytes)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not allocate shared memory for {expected_bytes} bytes: {e}")
         raise HTTPException(
-            status_code=500,
-            detail=f"C++ executable not found at {EXECUTABLE_PATH}. Make sure to build the project first."
+            status_code=413,
+            detail=f"Could not allocate shared memory for {expected_bytes} bytes"
         )
-    
     try:
-        # Prepare command with optional parameters
-        command = [EXECUTABLE_PATH, str(width), str(height)]
+        await read_body_into(request, segment.buf, expected_bytes)
         
-        # Add optional parameters only if they were explicitly provided in the query string
-        if param_provided["min_normal_diff"] and min_normal_diff is not None:
-            command.extend(["--min-normal-diff", str(min_normal_diff)])
-            
-        if param_provided["max_dist"] and max_dist is not None:
-            command.extend(["--max-dist", str(max_dist)])
-            
-        if param_provided["outlier_ratio"] and outlier_ratio is not None:
-            command.extend(["--outlier-ratio", str(outlier_ratio)])
+        try:
+            params = worker_params(min_normal_diff, max_dist, outlier_ratio, min_num_points, nr_neighbors, max_planes)
             
-        if param_provided["min_num_points"] and min_num_points is not None:
-            command.extend(["--min-num-points", str(min_num_points)])
+            output = cache_key = None
+            if expected_bytes <= RESPONSE_CACHE_MAX_BYTES:
+                cache_key = response_cache_key(width, height, params, segment.buf[:expected_bytes])
+                output = response_cache.get(cache_key)
             
-        if param_provided["nr_neighbors"] and nr_neighbors is not None:
-            command.extend(["--nr-neighbors", str(nr_neighbors)])
-            
-        if param_provided["max_planes"] and max_planes is not None:
-            command.extend(["--max-planes", str(max_planes)])
-        
-        # Log the command being executed
-        logger.info(f"Executing C++ command: {' '.join(command)}")
-        
-        # Run the C++ program and pass the binary data directly
-        process = subprocess.Popen(
-            command,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        # Send binary input and get output
-        stdout, stderr = process.communicate(input=binary_data)
-        
-        stderr_output = stderr.decode() if stderr else ""
-        
-        # Log stderr output even if the process succeeds (for debugging)
-        if stderr_output:
-            print("\n--- C++ APPLICATION DEBUG OUTPUT ---")
-            print(stderr_output)
-            print("--- END C++ DEBUG OUTPUT ---\n")
-            
-        if process.returncode != 0:
-            raise HTTPException(
-                status_code=500,
-                detail=f"C++ process failed with code {process.returncode}: {stderr_output}"
-            )
-        
-        # Parse JSON output
-        try:
-            stdout_text = stdout.decode()
-            logger.info(f"C++ process completed with return code: {process.returncode}")
+            if output is None:
+                try:
+                    output = await batcher.detect(width, height, params, segment)
+                except WorkerError as e:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"C++ process failed: {e}"
+                    )
+                logger.info("C++ worker completed")
+                if cache_key is not None:
+                    response_cache[cache_key] = output
+            else:
+                logger.info("Served from response cache")
             
+            # Decode the binary plane list, or pass it through untouched
             try:
-                planes = json.loads(stdout_text)
-                logger.info(f"Successfully parsed JSON output: {len(planes)} planes detected")
-                return planes
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse JSON output: {e}")
-                logger.error(f"First 200 chars of output: {stdout_text[:200]}")
+                if binary:
+                    return Response(content=output, media_type="application/octet-stream")
+                
+                planes = decode_planes(output)
+                logger.info(f"Successfully decoded output: {len(planes)} planes detected")
+                return json_response(planes)
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing C++ output: {str(e)}")
                 raise HTTPException(
                     status_code=500,
-                    detail=f"Failed to parse JSON output: {e}. Output was: {stdout_text[:200]}..."
+                    detail=f"Error processing C++ output: {str(e)}"
                 )
+        
+        except HTTPException:
+            raise
         except Exception as e:
-            logger.error(f"Error processing C++ output: {str(e)}")
             raise HTTPException(
                 status_code=500,
-                detail=f"Error processing C++ output: {str(e)}"
+                detail=f"Failed to process request: {str(e)}"
             )
+    except asyncio.CancelledError:
+        # A worker may still be reading the segment, so it can't be reused
+        segment.release()
+        raise
+    finally:
+        segments.release(segment)
+
+# Frame header for /planes/stream: width, height, min_normal_diff, max_dist,
+# outlier_ratio, min_num_points, nr_neighbors, max_planes, flags. These are
+# the worker header fields (see worker_pool.HEADER and its flag bits), so
+# parameters are only applied if their flag is set
+STREAM_HEADER = struct.Struct("<IIfffIIII")
+
+# Streams keep a C++ worker for their whole connection, so they get their own
+# instead of starving the pool. PLANES_MAX_STREAMS (default: the pool size)
+# caps how many can be open at once. When pinning, stream workers share all of
+# WORKER_CPUS, so they stay off the CPUs reserved for the server
+MAX_STREAMS = int(os.environ.get("PLANES_MAX_STREAMS", WORKER_POOL_SIZE))
+streams = set()
+
+# Streaming endpoint for continuous sessions (e.g. live depth cameras). Each
+# binary message is a STREAM_HEADER followed by the raw f32 xyz points, and is
+# answered with the packed plane records (as with "Accept:
+# application/octet-stream" on /planes), or a JSON text message with an error
+# detail. Each connection has a C++ worker of its own for its whole lifetime.
+@app.websocket("/planes/stream")
+async def stream_planes(websocket: WebSocket):
+    if len(streams) >= MAX_STREAMS:
+        # 1013: try again later
+        logger.warning(f"Refusing stream: {len(streams)} streams already open")
+        await websocket.close(code=1013)
+        return
     
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to process request: {str(e)}"
-        )
+    streams.add(websocket)
+    worker = segment = None
+    try:
+        worker = await Worker.spawn(EXECUTABLE_PATH, quiet=pool.quiet, cpus=WORKER_CPUS)
+        await websocket.accept()
+        while True:
+            received = await websocket.receive()
+            if received["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(received.get("code", 1000), received.get("reason"))
+            message = received.get("bytes")
+            if message is None:
+                await websocket.send_json({"detail": "Expected a binary frame"})
+                continue
+            if len(message) < STREAM_HEADER.size:
+                await websocket.send_json({"detail": f"Frame too short: got {len(message)} bytes, expected at least {STREAM_HEADER.size} bytes"})
+                continue
+            
+            width, height, *params = STREAM_HEADER.unpack_from(message)
+            if width == 0 or height == 0:
+                await websocket.send_bytes(NO_PLANES)
+                continue
+            if width * height > MAX_POINTS:
+                await websocket.send_json({"detail": f"Point cloud too large: {width * height} points, at most {MAX_POINTS} are accepted"})
+                continue
+            data_size = len(message) - STREAM_HEADER.size
+            expected_bytes = 4 * 3 * width * height
+            if data_size != expected_bytes:
+                await websocket.send_json({"detail": f"Binary data size mismatch: got {data_size} bytes, expected {expected_bytes} bytes"})
+                continue
+            
+            # Keep the connection's segment while the frame size stays the same
+            if segment is None or segment.size != expected_bytes:
+                if segment is not None:
+                    segments.release(segment)
+                    segment = None
+                try:
+                    segment = segments.acquire(expected_bytes)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not allocate shared memory for {expected_bytes} bytes: {e}")
+                    await websocket.send_json({"detail": f"Could not allocate shared memory for {expected_bytes} bytes"})
+                    continue
+            segment.buf[:expected_bytes] = memoryview(message)[STREAM_HEADER.size:]
+            
+            try:
+                planes = await worker.detect(width, height, tuple(params), segment)
+            except WorkerError as e:
+                if not worker.alive:
+                    # Swap the dead worker for a fresh one and carry on
+                    await worker.close()
+                    worker = await Worker.spawn(EXECUTABLE_PATH, quiet=pool.quiet, cpus=WORKER_CPUS)
+                await websocket.send_json({"detail": f"C++ process failed: {e}"})
+                continue
+            await websocket.send_bytes(planes)
+    except WebSocketDisconnect:
+        pass
+    except asyncio.CancelledError:
+        # The worker may still be reading the segment, so it can't be reused
+        if segment is not None:
+            segment.release()
+        raise
+    finally:
+        streams.discard(websocket)
+        if worker is not None:
+            await worker.close()
+        if segment is not None:
+            segments.release(segment)
+
+# Largest /planes/stream message: a full-size cloud and its header. uvicorn's
+# default limit (16 MiB) is below a single 1920x1080 frame, so when running
+# uvicorn directly, pass "--ws-max-size" of at least this
+WS_MAX_SIZE = MAX_POINTS * 4 * 3 + STREAM_HEADER.size
 
-# Run with: uvicorn server:app --reload
+# Run with: python server.py [dev|prod]
+#   dev:  single process with auto-reload
+#   prod: PLANES_UVICORN_WORKERS processes (default: half the cores) on uvloop/httptools
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run("server:app", host="0.0.0.0", port=8555, reload=True)
\ No newline at end of file
+    mode = sys.argv[1] if len(sys.argv) > 1 else "dev"
+    if mode == "prod":
+        workers = int(os.environ.get("PLANES_UVICORN_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+        # Tell each uvicorn worker how many siblings share the cores
+        os.environ["PLANES_UVICORN_WORKERS"] = str(workers)
+        uvicorn.run("server:app", host="0.0.0.0", port=8555, workers=workers, loop="uvloop", http="httptools", ws_max_size=WS_MAX_SIZE)
+    elif mode == "dev":
+        uvicorn.run("server:app", host="0.0.0.0", port=8555, reload=True, ws_max_size=WS_MAX_SIZE)
+    else:
+        sys.exit(f"Unknown mode: {mode} (expected dev or prod)")
@@ -1,4 +1,5 @@
 #include <chrono>
+#include <cstdint>
 #include <iostream>
 #include <memory>
 #include <set>
@@ -6,7 +7,16 @@
 #include <fstream>
 #include <sstream>
 #include <cstdio>
+#include <cstring>
 #include <algorithm>   // For std::sort
+#include <list>
+#include <stdexcept>
+#include <string>
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 
 #include <Eigen/Dense>
 #include <open3d/Open3D.h>
@@ -15,60 +25,175 @@
 
 using namespace open3d;
 
-void output_json(const std::set<Plane*>& planes_set, int maxPlanes = -1) {
+// Detection parameters. Each parameter is only applied if it was provided,
+// otherwise the PlaneDetector defaults are used.
+struct DetectionParams {
+    double minNormalDiff = 60.0;    // degrees
+    double maxDist = 75.0;          // degrees
+    double outlierRatio = 0.75;     // ratio
+    size_t minNumPoints = 30;       // count
+    int nrNeighbors = 75;           // count
+    int maxPlanes = -1;             // no limit by default
+
+    bool minNormalDiffProvided = false;
+    bool maxDistProvided = false;
+    bool outlierRatioProvided = false;
+    bool minNumPointsProvided = false;
+    bool nrNeighborsProvided = false;
+    bool maxPlanesProvided = false;
+};
+
+// Header of every request in --serve mode. A request is a batch of
+// `count` same-shape point clouds sharing the same parameters; the header is
+// followed, for each cloud, by a uint32 name length and the name of the POSIX
+// shared memory segment holding its f32 xyz points. Must match
+// worker_pool.HEADER on the Python side. Parameters whose bit is not set in
+// `flags` are ignored and the process defaults are used instead.
+#pragma pack(push, 1)
+struct RequestHeader {
+    uint32_t width;
+    uint32_t height;
+    float minNormalDiff;
+    float maxDist;
+    float outlierRatio;
+    uint32_t minNumPoints;
+    uint32_t nrNeighbors;
+    uint32_t maxPlanes;
+    uint32_t flags;
+    uint32_t count;
+};
+
+// Bits of RequestHeader::flags
+enum RequestFlags : uint32_t {
+    kMinNormalDiff = 1 << 0,
+    kMaxDist = 1 << 1,
+    kOutlierRatio = 1 << 2,
+    kMinNumPoints = 1 << 3,
+    kNrNeighbors = 1 << 4,
+    kMaxPlanes = 1 << 5,
+};
+
+// Header preceding every reply in --serve mode, one reply per cloud of the
+// batch in order. The payload is the planes encoded by encode_planes, or an
+// error message if the status is non-zero.
+struct ResponseHeader {
+    uint32_t status;
+    uint32_t numBytes;
+};
+#pragma pack(pop)
+
+static_assert(sizeof(RequestHeader) == 40, "RequestHeader must match worker_pool.HEADER");
+static_assert(sizeof(ResponseHeader) == 8, "ResponseHeader must match worker_pool.RESPONSE");
+
+// Set by --quiet: diagnostics are dropped and only fatal errors are printed
+bool quiet = false;
+
+// Stream for diagnostic output, discarded in quiet mode
+std::ostream& debug_log() {
+    static std::ostream null_stream(nullptr);
+    return quiet ? null_stream : std::cerr;
+}
+
+// Packed plane record written in --serve mode, after a uint32 plane count.
+// Must match worker_pool.PLANE on the Python side.
+#pragma pack(push, 1)
+struct PlaneRecord {
+    float normal[3];
+    float center[3];
+    float basisU[3];
+    float basisV[3];
+    float distanceFromOrigin;
+    uint32_t inlierCount;
+};
+#pragma pack(pop)
+
+static_assert(sizeof(PlaneRecord) == 56, "PlaneRecord must match worker_pool.PLANE");
+
+// Sort planes by inlier count and keep at most maxPlanes of them, if specified
+std::vector<Plane*> sort_planes(const std::set<Plane*>& planes_set, int maxPlanes = -1) {
     // Convert set to vector for sorting
     std::vector<Plane*> planes(planes_set.begin(), planes_set.end());
-    
+
     // Log before sorting
-    std::cerr << "Planes before sorting:" << std::endl;
+    debug_log() << "Planes before sorting:" << std::endl;
     for (size_t i = 0; i < planes.size(); i++) {
-        std::cerr << "  Plane " << i << ": " << planes[i]->inliers().size() << " inliers" << std::endl;
+        debug_log() << "  Plane " << i << ": " << planes[i]->inliers().size() << " inliers" << std::endl;
     }
-    
+
     // Sort planes by inlier count (descending order)
     std::sort(planes.begin(), planes.end(), [](const Plane* a, const Plane* b) {
         return a->inliers().size() > b->inliers().size();
     });
-    
+
     // Limit the number of planes if maxPlanes is specified
-    size_t numPlanesToOutput = planes.size();
-    if (maxPlanes > 0 && static_cast<size_t>(maxPlanes) < numPlanesToOutput) {
-        numPlanesToOutput = static_cast<size_t>(maxPlanes);
-        std::cerr << "Limiting output to " << numPlanesToOutput << " planes (out of " << planes.size() << " detected)" << std::endl;
+    if (maxPlanes > 0 && static_cast<size_t>(maxPlanes) < planes.size()) {
+        debug_log() << "Limiting output to " << maxPlanes << " planes (out of " << planes.size() << " detected)" << std::endl;
+        planes.resize(static_cast<size_t>(maxPlanes));
     }
-    
+
     // Log after sorting
-    std::cerr << "Planes after sorting (descending by inlier count):" << std::endl;
-    for (size_t i = 0; i < numPlanesToOutput; i++) {
-        std::cerr << "  Plane " << i << ": " << planes[i]->inliers().size() << " inliers" << std::endl;
-    }
-    
-    // Output sorted planes as JSON
-    std::cout << "[" << std::endl;
-    
-    for (size_t i = 0; i < numPlanesToOutput; i++) {
+    debug_log() << "Planes after sorting (descending by inlier count):" << std::endl;
+    for (size_t i = 0; i < planes.size(); i++) {
+        debug_log() << "  Plane " << i << ": " << planes[i]->inliers().size() << " inliers" << std::endl;
+    }
+
+    return planes;
+}
+
+void output_json(std::ostream& out, const std::vector<Plane*>& planes) {
+    out << "[" << std::endl;
+
+    for (size_t i = 0; i < planes.size(); i++) {
         Plane* p = planes[i];
-        std::cout << "  {" << std::endl;
-        std::cout << "    \"normal\": [" << p->normal().x() << ", " << p->normal().y() << ", " << p->normal().z() << "]," << std::endl;
-        std::cout << "    \"center\": [" << p->center().x() << ", " << p->center().y() << ", " << p->center().z() << "]," << std::endl;
-        std::cout << "    \"basisU\": [" << p->basisU().x() << ", " << p->basisU().y() << ", " << p->basisU().z() << "]," << std::endl;
-        std::cout << "    \"basisV\": [" << p->basisV().x() << ", " << p->basisV().y() << ", " << p->basisV().z() << "]," << std::endl;
-        std::cout << "    \"distanceFromOrigin\": " << p->distanceFromOrigin() << "," << std::endl;
-        std::cout << "    \"inlierCount\": " << p->inliers().size() << std::endl;
-        std::cout << "  }";
-        
-        if (i < numPlanesToOutput - 1) {
-            std::cout << "," << std::endl;
+        out << "  {" << std::endl;
+        out << "    \"normal\": [" << p->normal().x() << ", " << p->normal().y() << ", " << p->normal().z() << "]," << std::endl;
+        out << "    \"center\": [" << p->center().x() << ", " << p->center().y() << ", " << p->center().z() << "]," << std::endl;
+        out << "    \"basisU\": [" << p->basisU().x() << ", " << p->basisU().y() << ", " << p->basisU().z() << "]," << std::endl;
+        out << "    \"basisV\": [" << p->basisV().x() << ", " << p->basisV().y() << ", " << p->basisV().z() << "]," << std::endl;
+        out << "    \"distanceFromOrigin\": " << p->distanceFromOrigin() << "," << std::endl;
+        out << "    \"inlierCount\": " << p->inliers().size() << std::endl;
+        out << "  }";
+
+        if (i < planes.size() - 1) {
+            out << "," << std::endl;
         } else {
-            std::cout << std::endl;
+            out << std::endl;
         }
     }
-    
-    std::cout << "]" << std::endl;
+
+    out << "]" << std::endl;
+}
+
+void copy_vector(float* dst, const Eigen::Vector3d& v) {
+    dst[0] = static_cast<float>(v.x());
+    dst[1] = static_cast<float>(v.y());
+    dst[2] = static_cast<float>(v.z());
+}
+
+// Encode planes as a uint32 count followed by packed PlaneRecords
+std::string encode_planes(const std::vector<Plane*>& planes) {
+    uint32_t count = static_cast<uint32_t>(planes.size());
+    std::string out(sizeof(count) + planes.size() * sizeof(PlaneRecord), '\0');
+    memcpy(&out[0], &count, sizeof(count));
+
+    for (size_t i = 0; i < planes.size(); i++) {
+        const Plane* p = planes[i];
+        PlaneRecord record;
+        copy_vector(record.normal, p->normal());
+        copy_vector(record.center, p->center());
+        copy_vector(record.basisU, p->basisU());
+        copy_vector(record.basisV, p->basisV());
+        record.distanceFromOrigin = p->distanceFromOrigin();
+        record.inlierCount = static_cast<uint32_t>(p->inliers().size());
+        memcpy(&out[sizeof(count) + i * sizeof(PlaneRecord)], &record, sizeof(record));
+    }
+
+    return out;
 }
 
 void print_usage(const char* program_name) {
     std::cerr << "Usage: " << program_name << " <width> <height> [options]" << std::endl;
+    std::cerr << "       " << program_name << " --serve [options]" << std::endl;
     std::cerr << "Options:" << std::endl;
     std::cerr << "  --min-normal-diff <degrees>     Minimum normal difference (default: 60)" << std::endl;
     std::cerr << "  --max-dist <degrees>            Maximum distance (default: 75)" << std::endl;
@@ -76,103 +201,67 @@ void print_usage(const char* program_name) {
     std::cerr << "  --min-num-points <count>        Minimum number of points (default: 30)" << std::endl;
     std::cerr << "  --nr-neighbors <count>          Number of neighbors for KNN (default: 75)" << std::endl;
     std::cerr << "  --max-planes <count>            Maximum number of planes to return" << std::endl;
+    std::cerr << "  --quiet                         Only print fatal errors to stderr" << std::endl;
+    std::cerr << "In --serve mode, point clouds are read from stdin in a loop, each one" << std::endl;
+    std::cerr << "preceded by a request header, and the options act as per-process defaults." << std::endl;
 }
 
-int main(int argc, char *argv[]) {
-    // Parse width and height from command line arguments
-    if (argc < 3) {
-        print_usage(argv[0]);
-        return 1;
-    }
-    
-    // Debug output: show received command-line arguments
-    std::cerr << "Command-line arguments received:" << std::endl;
-    for (int i = 0; i < argc; i++) {
-        std::cerr << "  argv[" << i << "]: " << argv[i] << std::endl;
-    }
-    
-    int width = std::stoi(argv[1]);
-    int height = std::stoi(argv[2]);
-    int totalPoints = width * height;
-    
-    // Default parameter values
-    double minNormalDiff = 60.0;    // degrees
-    double maxDist = 75.0;          // degrees
-    double outlierRatio = 0.75;     // ratio
-    size_t minNumPoints = 30;       // count
-    int nrNeighbors = 75;           // count
-    int maxPlanes = -1;             // no limit by default
-    
-    // Track which parameters were provided
-    bool minNormalDiffProvided = false;
-    bool maxDistProvided = false;
-    bool outlierRatioProvided = false;
-    bool minNumPointsProvided = false;
-    bool nrNeighborsProvided = false;
-    bool maxPlanesProvided = false;
-    
-    // Parse optional parameters
-    for (int i = 3; i < argc; i++) {
+// Parse optional parameters starting at argv[first]
+bool parse_options(int argc, char *argv[], int first, DetectionParams& params) {
+    for (int i = first; i < argc; i++) {
         std::string arg = argv[i];
-        
+
         if (arg == "--min-normal-diff" && i + 1 < argc) {
-            minNormalDiff = std::stod(argv[++i]);
-            minNormalDiffProvided = true;
+            params.minNormalDiff = std::stod(argv[++i]);
+            params.minNormalDiffProvided = true;
         } else if (arg == "--max-dist" && i + 1 < argc) {
-            maxDist = std::stod(argv[++i]);
-            maxDistProvided = true;
+            params.maxDist = std::stod(argv[++i]);
+            params.maxDistProvided = true;
         } else if (arg == "--outlier-ratio" && i + 1 < argc) {
-            outlierRatio = std::stod(argv[++i]);
-            outlierRatioProvided = true;
+            params.outlierRatio = std::stod(argv[++i]);
+            params.outlierRatioProvided = true;
         } else if (arg == "--min-num-points" && i + 1 < argc) {
-            minNumPoints = std::stoi(argv[++i]);
-            minNumPointsProvided = true;
+            params.minNumPoints = std::stoi(argv[++i]);
+            params.minNumPointsProvided = true;
         } else if (arg == "--nr-neighbors" && i + 1 < argc) {
-            nrNeighbors = std::stoi(argv[++i]);
-            nrNeighborsProvided = true;
+            params.nrNeighbors = std::stoi(argv[++i]);
+            params.nrNeighborsProvided = true;
         } else if (arg == "--max-planes" && i + 1 < argc) {
-            maxPlanes = std::stoi(argv[++i]);
-            maxPlanesProvided = true;
+            params.maxPlanes = std::stoi(argv[++i]);
+            params.maxPlanesProvided = true;
+        } else if (arg == "--quiet") {
+            quiet = true;
         } else {
             std::cerr << "Unknown parameter: " << arg << std::endl;
-            print_usage(argv[0]);
-            return 1;
+            return false;
         }
     }
-    
-    // Read binary f32 points from stdin
-    std::vector<Eigen::Vector3d> points;
-    points.reserve(totalPoints);
-    
-    float point_buffer[3];
-    for (int i = 0; i < totalPoints; i++) {
-        // Read 3 floats (12 bytes) for each point
-        if (fread(point_buffer, sizeof(float), 3, stdin) != 3) {
-            std::cerr << "Error reading point " << i << std::endl;
-            return 1;
-        }
-        points.push_back(Eigen::Vector3d(point_buffer[0], point_buffer[1], point_buffer[2]));
-    }
-    
-    // Create Open3D point cloud
+    return true;
+}
+
+// Build an Open3D point cloud from packed f32 xyz triplets
+std::shared_ptr<geometry::PointCloud> make_cloud(const float* data, size_t totalPoints) {
     auto cloud_ptr = std::make_shared<geometry::PointCloud>();
-    for (const auto& point : points) {
-        cloud_ptr->points_.push_back(point);
-    }
-    
-    // Use default number of neighbors (75) unless explicitly provided
-    const int knnNeighbors = nrNeighborsProvided ? nrNeighbors : 75;
-    const geometry::KDTreeSearchParam &search_param = geometry::KDTreeSearchParamKNN(knnNeighbors);
-    
+    cloud_ptr->points_.reserve(totalPoints);
+    for (size_t i = 0; i < totalPoints; i++) {
+        cloud_ptr->points_.push_back(Eigen::Vector3d(data[3 * i], data[3 * i + 1], data[3 * i + 2]));
+    }
+    return cloud_ptr;
+}
+
+// Run the plane detector on a cloud. The returned planes are owned by the caller.
+std::set<Plane*> run_detection(const std::shared_ptr<geometry::PointCloud>& cloud_ptr, const DetectionParams& params) {
+    const geometry::KDTreeSearchParam &search_param = geometry::KDTreeSearchParamKNN(params.nrNeighbors);
+
     // Estimate normals
     cloud_ptr->EstimateNormals(search_param);
-    
+
     // Build KD tree for neighbor search
     geometry::KDTreeFlann kdtree;
     kdtree.SetGeometry(*cloud_ptr);
     std::vector<std::vector<int>> neighbors;
     neighbors.resize(cloud_ptr->points_.size());
-    
+
     #pragma omp parallel for schedule(static)
     for (int i = 0; i < (int)cloud_ptr->points_.size(); i++) {
         std::vector<int> indices;
@@ -181,58 +270,292 @@ int main(int argc, char *argv[]) {
             neighbors[i] = indices;
         }
     }
-    
-    // Create PlaneDetector with appropriate minNumPoints
-    size_t effectiveMinNumPoints = minNumPointsProvided ? minNumPoints : 30;
-    PlaneDetector rspd(cloud_ptr, neighbors, effectiveMinNumPoints);
-    
+
+    PlaneDetector rspd(cloud_ptr, neighbors, params.minNumPoints);
+
     // Debug output for parameters
-    std::cerr << "Point cloud has " << cloud_ptr->points_.size() << " points" << std::endl;
-    std::cerr << "Parameters used:" << std::endl;
-    std::cerr << "  minNumPoints: " << effectiveMinNumPoints 
-              << (minNumPointsProvided ? " (user-provided)" : " (default)") << std::endl;
-    std::cerr << "  nrNeighbors: " << knnNeighbors 
-              << (nrNeighborsProvided ? " (user-provided)" : " (default)") << std::endl;
-    if (maxPlanesProvided) {
-        std::cerr << "  maxPlanes: " << maxPlanes << " (user-provided)" << std::endl;
-    }
-    
+    debug_log() << "Point cloud has " << cloud_ptr->points_.size() << " points" << std::endl;
+    debug_log() << "Parameters used:" << std::endl;
+    debug_log() << "  minNumPoints: " << params.minNumPoints
+              << (params.minNumPointsProvided ? " (user-provided)" : " (default)") << std::endl;
+    debug_log() << "  nrNeighbors: " << params.nrNeighbors
+              << (params.nrNeighborsProvided ? " (user-provided)" : " (default)") << std::endl;
+    if (params.maxPlanesProvided) {
+        debug_log() << "  maxPlanes: " << params.maxPlanes << " (user-provided)" << std::endl;
+    }
+
     // Only set parameters that were explicitly provided
     // Set and log parameters with safer handling
-    if (minNormalDiffProvided) {
-        rspd.minNormalDiff(minNormalDiff);
-        std::cerr << "  minNormalDiff: " << minNormalDiff << " (user-provided)" << std::endl;
+    if (params.minNormalDiffProvided) {
+        rspd.minNormalDiff(params.minNormalDiff);
+        debug_log() << "  minNormalDiff: " << params.minNormalDiff << " (user-provided)" << std::endl;
     } else {
         // Don't try to access the getter if it might not exist
-        std::cerr << "  minNormalDiff: using default value" << std::endl;
+        debug_log() << "  minNormalDiff: using default value" << std::endl;
     }
-    
-    if (maxDistProvided) {
-        rspd.maxDist(maxDist);
-        std::cerr << "  maxDist: " << maxDist << " (user-provided)" << std::endl;
+
+    if (params.maxDistProvided) {
+        rspd.maxDist(params.maxDist);
+        debug_log() << "  maxDist: " << params.maxDist << " (user-provided)" << std::endl;
     } else {
-        std::cerr << "  maxDist: using default value" << std::endl;
+        debug_log() << "  maxDist: using default value" << std::endl;
     }
-    
-    if (outlierRatioProvided) {
-        rspd.outlierRatio(outlierRatio);
-        std::cerr << "  outlierRatio: " << outlierRatio << " (user-provided)" << std::endl;
+
+    if (params.outlierRatioProvided) {
+        rspd.outlierRatio(params.outlierRatio);
+        debug_log() << "  outlierRatio: " << params.outlierRatio << " (user-provided)" << std::endl;
     } else {
-        std::cerr << "  outlierRatio: using default value" << std::endl;
+        debug_log() << "  outlierRatio: using default value" << std::endl;
     }
-    
+
     // Detect planes
     auto start_time = std::chrono::high_resolution_clock::now();
     std::set<Plane*> planes = rspd.detect();
     auto end_time = std::chrono::high_resolution_clock::now();
     auto duration = std::chrono::duration_cast<std::chrono::milliseconds>(end_time - start_time).count();
-    
+
     // Debug output for results
-    std::cerr << "Plane detection completed in " << duration << " ms" << std::endl;
-    std::cerr << "Detected " << planes.size() << " planes" << std::endl;
-    
+    debug_log() << "Plane detection completed in " << duration << " ms" << std::endl;
+    debug_log() << "Detected " << planes.size() << " planes" << std::endl;
+
+    return planes;
+}
+
+void free_planes(std::set<Plane*>& planes) {
+    for (Plane* p : planes) {
+        delete p;
+    }
+    planes.clear();
+}
+
+bool read_exact(void* dst, size_t size) {
+    return fread(dst, 1, size, stdin) == size;
+}
+
+void write_response(uint32_t status, const std::string& payload) {
+    ResponseHeader header = {status, static_cast<uint32_t>(payload.size())};
+    fwrite(&header, sizeof(header), 1, stdout);
+    fwrite(payload.data(), 1, payload.size(), stdout);
+    fflush(stdout);
+}
+
+// Read-only mapping of a shared memory segment written by the server
+class SharedMapping {
+public:
+    explicit SharedMapping(const std::string& name)
+        : mName(name) {
+        // Python's SharedMemory names omit the leading slash shm_open wants
+        std::string path = name[0] == '/' ? name : "/" + name;
+        mFd = shm_open(path.c_str(), O_RDONLY, 0);
+        if (mFd < 0) {
+            throw std::runtime_error("Failed to open shared memory segment " + path);
+        }
+        struct stat st;
+        if (fstat(mFd, &st) == 0 && st.st_size > 0) {
+            mSize = static_cast<size_t>(st.st_size);
+            mData = mmap(nullptr, mSize, PROT_READ, MAP_SHARED, mFd, 0);
+        }
+        if (mData == MAP_FAILED || mData == nullptr) {
+            close(mFd);
+            throw std::runtime_error("Failed to map shared memory segment " + path);
+        }
+    }
+
+    ~SharedMapping() {
+        munmap(mData, mSize);
+        close(mFd);
+    }
+
+    SharedMapping(const SharedMapping&) = delete;
+    SharedMapping& operator=(const SharedMapping&) = delete;
+
+    const std::string& name() const {
+        return mName;
+    }
+
+    const float* points() const {
+        return static_cast<const float*>(mData);
+    }
+
+    size_t size() const {
+        return mSize;
+    }
+
+    // Whether the server has unlinked the segment, i.e. will never send it again
+    bool unlinked() const {
+        struct stat st;
+        return fstat(mFd, &st) != 0 || st.st_nlink == 0;
+    }
+
+private:
+    std::string mName;
+    int mFd = -1;
+    void* mData = nullptr;
+    size_t mSize = 0;
+};
+
+// The server reuses its segments across requests, so mappings are kept
+// around instead of paying shm_open + mmap per cloud. Segments the server has
+// unlinked are dropped right away so they don't stay pinned in memory.
+class MappingCache {
+public:
+    explicit MappingCache(size_t capacity)
+        : mCapacity(capacity) {}
+
+    const SharedMapping& get(const std::string& name) {
+        for (auto it = mMappings.begin(); it != mMappings.end();) {
+            if ((*it)->unlinked()) {
+                it = mMappings.erase(it);
+            } else {
+                ++it;
+            }
+        }
+
+        // Most recently used first
+        for (auto it = mMappings.begin(); it != mMappings.end(); ++it) {
+            if ((*it)->name() == name) {
+                mMappings.splice(mMappings.begin(), mMappings, it);
+                return *mMappings.front();
+            }
+        }
+
+        mMappings.emplace_front(new SharedMapping(name));
+        if (mMappings.size() > mCapacity) {
+            mMappings.pop_back();
+        }
+        return *mMappings.front();
+    }
+
+private:
+    size_t mCapacity;
+    std::list<std::unique_ptr<SharedMapping>> mMappings;
+};
+
+// Detect planes in the cloud held by the named segment and write the reply
+void serve_cloud(MappingCache& mappings, const std::string& name, size_t totalPoints, const DetectionParams& params) {
+    try {
+        const SharedMapping& mapping = mappings.get(name);
+        if (mapping.size() < totalPoints * 3 * sizeof(float)) {
+            std::ostringstream message;
+            message << "Shared memory segment too small: got " << mapping.size() << " bytes, expected "
+                    << totalPoints * 3 * sizeof(float) << " bytes";
+            write_response(1, message.str());
+            return;
+        }
+
+        std::set<Plane*> planes = run_detection(make_cloud(mapping.points(), totalPoints), params);
+        std::string payload = encode_planes(sort_planes(planes, params.maxPlanes));
+        free_planes(planes);
+        write_response(0, payload);
+    } catch (const std::exception& e) {
+        write_response(1, e.what());
+    }
+}
+
+// Serve batches of point clouds until stdin is closed, writing one response
+// per cloud to stdout. The process (and its allocator / thread pool) stays
+// warm between requests, and the points are read straight from shared memory
+// instead of being copied through the pipe.
+int serve(const DetectionParams& defaults) {
+    RequestHeader header;
+    std::vector<std::string> names;
+    MappingCache mappings(64);
+
+    while (read_exact(&header, sizeof(header))) {
+        names.resize(header.count);
+        for (std::string& name : names) {
+            uint32_t nameLength;
+            if (!read_exact(&nameLength, sizeof(nameLength))) {
+                std::cerr << "Error reading shared memory name" << std::endl;
+                return 1;
+            }
+            name.resize(nameLength);
+            if (!read_exact(&name[0], nameLength)) {
+                std::cerr << "Error reading shared memory name" << std::endl;
+                return 1;
+            }
+        }
+
+        // Per-request parameters override the process defaults
+        DetectionParams params = defaults;
+        if (header.flags & kMinNormalDiff) {
+            params.minNormalDiff = header.minNormalDiff;
+            params.minNormalDiffProvided = true;
+        }
+        if (header.flags & kMaxDist) {
+            params.maxDist = header.maxDist;
+            params.maxDistProvided = true;
+        }
+        if (header.flags & kOutlierRatio) {
+            params.outlierRatio = header.outlierRatio;
+            params.outlierRatioProvided = true;
+        }
+        if (header.flags & kMinNumPoints) {
+            params.minNumPoints = header.minNumPoints;
+            params.minNumPointsProvided = true;
+        }
+        if (header.flags & kNrNeighbors) {
+            params.nrNeighbors = header.nrNeighbors;
+            params.nrNeighborsProvided = true;
+        }
+        if (header.flags & kMaxPlanes) {
+            params.maxPlanes = header.maxPlanes;
+            params.maxPlanesProvided = true;
+        }
+
+        size_t totalPoints = static_cast<size_t>(header.width) * header.height;
+        for (const std::string& name : names) {
+            serve_cloud(mappings, name, totalPoints, params);
+        }
+    }
+
+    return 0;
+}
+
+int main(int argc, char *argv[]) {
+    if (argc >= 2 && std::string(argv[1]) == "--serve") {
+        DetectionParams defaults;
+        if (!parse_options(argc, argv, 2, defaults)) {
+            print_usage(argv[0]);
+            return 1;
+        }
+        return serve(defaults);
+    }
+
+    // Parse width and height from command line arguments
+    if (argc < 3) {
+        print_usage(argv[0]);
+        return 1;
+    }
+
+    int width = std::stoi(argv[1]);
+    int height = std::stoi(argv[2]);
+    size_t totalPoints = static_cast<size_t>(width) * height;
+
+    DetectionParams params;
+    if (!parse_options(argc, argv, 3, params)) {
+        print_usage(argv[0]);
+        return 1;
+    }
+
+    // Debug output: show received command-line arguments
+    debug_log() << "Command-line arguments received:" << std::endl;
+    for (int i = 0; i < argc; i++) {
+        debug_log() << "  argv[" << i << "]: " << argv[i] << std::endl;
+    }
+
+    // Read binary f32 points from stdin
+    std::vector<float> buffer(totalPoints * 3);
+    if (!read_exact(buffer.data(), buffer.size() * sizeof(float))) {
+        std::cerr << "Error reading " << totalPoints << " points" << std::endl;
+        return 1;
+    }
+
+    std::set<Plane*> planes = run_detection(make_cloud(buffer.data(), totalPoints), params);
+
     // Output planes as JSON, limiting by maxPlanes if specified
-    output_json(planes, maxPlanes);
-    
+    output_json(std::cout, sort_planes(planes, params.maxPlanes));
+    free_planes(planes);
+
     return 0;
-}
\ No newline at end of file
+}
@@ -0,0 +1,23 @@
+import os
+import stat
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def fake_worker(tmp_path):
+    """Path to an executable running tests/fake_worker.py with this interpreter."""
+    path = tmp_path / "stdin_planes"
+    script = os.path.join(ROOT, "tests", "fake_worker.py")
+    path.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
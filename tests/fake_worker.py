@@ -0,0 +1,58 @@
+"""Stand-in for ``stdin_planes --serve``, speaking the same pipe protocol.
+
+Each cloud is answered with a single plane whose center is the cloud's first
+point, whose inlierCount is its number of points and whose
+distanceFromOrigin is the number of clouds in its batch. A cloud whose first
+x is NaN gets an error reply instead, and one whose first x is -1 makes the
+worker exit with code 3, as if it crashed.
+"""
+import math
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from worker_pool import HEADER, NAME_LENGTH, PLANE, PLANE_COUNT, RESPONSE  # noqa: E402
+
+import numpy as np  # noqa: E402
+
+
+def read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) < size:
+        sys.exit(0)
+    return data
+
+
+def detect(name, width, height, batch_size):
+    with open(os.path.join("/dev/shm", name.lstrip("/")), "rb") as f:
+        x, y, z = struct.unpack("<3f", f.read(12))
+    if math.isnan(x):
+        return 1, b"bad cloud"
+    if x == -1:
+        sys.exit(3)
+    plane = np.zeros(1, dtype=PLANE)
+    plane["normal"] = (0, 0, 1)
+    plane["center"] = (x, y, z)
+    plane["distanceFromOrigin"] = batch_size
+    plane["inlierCount"] = width * height
+    return 0, PLANE_COUNT.pack(1) + plane.tobytes()
+
+
+def main():
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    while True:
+        width, height, *_, count = HEADER.unpack(read_exact(stdin, HEADER.size))
+        names = []
+        for _ in range(count):
+            [length] = NAME_LENGTH.unpack(read_exact(stdin, NAME_LENGTH.size))
+            names.append(read_exact(stdin, length).decode())
+        for name in names:
+            status, payload = detect(name, width, height, count)
+            stdout.write(RESPONSE.pack(status, len(payload)) + payload)
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import asyncio
+import math
+
+import pytest
+
+from batcher import DynamicBatcher
+from test_worker_pool import DEFAULT_PARAMS, make_segment
+from worker_pool import WorkerError, WorkerPool, decode_planes
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def pool(fake_worker):
+    pool = WorkerPool(fake_worker, 1)
+    await pool.start()
+    yield pool
+    await pool.close()
+
+
+async def test_busy_pool_coalesces_requests(pool):
+    batcher = DynamicBatcher(pool, max_batch_size=8, max_delay=0.05)
+    segments = [make_segment(x) for x in (1.0, math.nan, 3.0)]
+    other = make_segment(4.0)
+    try:
+        # With the only worker busy, the requests are held back together
+        worker = await pool.acquire()
+        tasks = [asyncio.ensure_future(batcher.detect(2, 2, DEFAULT_PARAMS, segment)) for segment in segments]
+        other_params = DEFAULT_PARAMS[:-1] + (1,)
+        other_task = asyncio.ensure_future(batcher.detect(2, 2, other_params, other))
+        await asyncio.sleep(0.01)
+        pool.release(worker)
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert isinstance(results[1], WorkerError)
+        for result, x in ((results[0], 1.0), (results[2], 3.0)):
+            [plane] = decode_planes(result)
+            assert plane["center"][0] == x
+            assert plane["distanceFromOrigin"] == 3
+
+        # Other parameters never share a batch
+        [plane] = decode_planes(await other_task)
+        assert plane["distanceFromOrigin"] == 1
+    finally:
+        for segment in segments + [other]:
+            segment.release()
+
+
+async def test_idle_pool_dispatches_immediately(pool):
+    batcher = DynamicBatcher(pool, max_batch_size=8, max_delay=10)
+    segment = make_segment(1.0)
+    try:
+        [plane] = decode_planes(await asyncio.wait_for(batcher.detect(2, 2, DEFAULT_PARAMS, segment), 5))
+        assert plane["distanceFromOrigin"] == 1
+    finally:
+        segment.release()
+
+
+async def test_crash_fails_whole_batch(pool):
+    batcher = DynamicBatcher(pool, max_batch_size=8, max_delay=0.05)
+    segments = [make_segment(x) for x in (1.0, -1.0)]
+    try:
+        worker = await pool.acquire()
+        tasks = [asyncio.ensure_future(batcher.detect(2, 2, DEFAULT_PARAMS, segment)) for segment in segments]
+        await asyncio.sleep(0.01)
+        pool.release(worker)
+
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            assert isinstance(result, WorkerError)
+
+        # The next batch gets a fresh worker
+        [plane] = decode_planes(await batcher.detect(2, 2, DEFAULT_PARAMS, segments[0]))
+        assert plane["center"][0] == 1.0
+    finally:
+        for segment in segments:
+            segment.release()
@@ -0,0 +1,116 @@
+import struct
+
+import lz4.frame
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+POINTS = struct.pack("<12f", *range(12))
+
+
+class FakeRequest:
+    def __init__(self, chunks, headers=None):
+        self.chunks = chunks
+        self.headers = headers or {}
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+async def read_body(chunks, expected_bytes=len(POINTS), headers=None):
+    buf = bytearray(expected_bytes)
+    await server.read_body_into(FakeRequest(chunks, headers), memoryview(buf), expected_bytes)
+    return bytes(buf)
+
+
+async def read_lz4(chunks, expected_bytes=len(POINTS)):
+    return await read_body(chunks, expected_bytes, {"content-encoding": "lz4"})
+
+
+async def test_read_body_in_chunks():
+    assert await read_body([POINTS[:20], POINTS[20:], b""]) == POINTS
+
+
+@pytest.mark.parametrize("chunks", [[POINTS, b"x"], [POINTS + POINTS]])
+async def test_read_body_overrun(chunks):
+    with pytest.raises(HTTPException) as e:
+        await read_body(chunks)
+    assert e.value.status_code == 400
+    assert "got more than 48 bytes" in e.value.detail
+
+
+async def test_read_body_too_short():
+    with pytest.raises(HTTPException) as e:
+        await read_body([POINTS[:-4]])
+    assert e.value.detail == "Binary data size mismatch: got 44 bytes, expected 48 bytes"
+
+
+async def test_read_lz4_body():
+    frame = lz4.frame.compress(POINTS)
+    assert await read_lz4([frame[:10], frame[10:]]) == POINTS
+
+
+async def test_read_lz4_overrun():
+    with pytest.raises(HTTPException) as e:
+        await read_lz4([lz4.frame.compress(POINTS * 1000)])
+    assert "got more than 48 bytes" in e.value.detail
+
+
+async def test_read_lz4_truncated():
+    with pytest.raises(HTTPException) as e:
+        await read_lz4([lz4.frame.compress(POINTS)[:-3]])
+    assert e.value.detail == "Invalid LZ4 data: truncated frame"
+
+
+@pytest.mark.parametrize("split", [False, True])
+async def test_read_lz4_trailing_data(split):
+    frame = lz4.frame.compress(POINTS)
+    with pytest.raises(HTTPException) as e:
+        await read_lz4([frame, b"junk"] if split else [frame + b"junk"])
+    assert e.value.detail == "Invalid LZ4 data: trailing data after the end of the frame"
+
+
+async def test_read_lz4_garbage():
+    with pytest.raises(HTTPException) as e:
+        await read_lz4([b"not an lz4 frame"])
+    assert e.value.detail.startswith("Invalid LZ4 data:")
+
+
+@pytest.fixture
+def client(fake_worker, monkeypatch):
+    monkeypatch.setattr(server, "EXECUTABLE_PATH", fake_worker)
+    monkeypatch.setattr(server.pool, "executable_path", fake_worker)
+    server.response_cache.clear()
+    with TestClient(server.app) as client:
+        yield client
+
+
+def test_detect_planes(client):
+    response = client.post("/planes?width=2&height=2", content=POINTS)
+    assert response.status_code == 200
+    [plane] = response.json()
+    assert plane["center"] == [0.0, 1.0, 2.0]
+    assert plane["inlierCount"] == 4
+
+
+def test_detect_planes_validates_params(client):
+    assert client.post("/planes?width=2&height=2&nr_neighbors=-1", content=POINTS).status_code == 422
+    assert client.post("/planes?width=2&height=2&max_dist=1e39", content=POINTS).status_code == 422
+    assert client.post("/planes?width=3&height=2", content=POINTS).status_code == 400
+
+
+def test_stream_planes(client):
+    header = server.STREAM_HEADER.pack(2, 2, 0, 0, 0, 0, 0, 0, 0)
+    with client.websocket_connect("/planes/stream") as websocket:
+        websocket.send_text("hello")
+        assert websocket.receive_json() == {"detail": "Expected a binary frame"}
+        websocket.send_bytes(header + POINTS[:-12])
+        assert websocket.receive_json()["detail"].startswith("Binary data size mismatch")
+        websocket.send_bytes(header + POINTS)
+        [plane] = server.decode_planes(websocket.receive_bytes())
+        assert plane["inlierCount"] == 4
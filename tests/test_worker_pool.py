@@ -0,0 +1,141 @@
+import math
+import struct
+
+import numpy as np
+import pytest
+
+from worker_pool import PLANE, PLANE_COUNT, SegmentPool, SharedSegment, WorkerError, WorkerPool, decode_planes
+
+pytestmark = pytest.mark.anyio
+
+# Parameter fields of the worker header, with no flags set
+DEFAULT_PARAMS = (0.0, 0.0, 0.0, 0, 0, 0, 0)
+
+
+def make_segment(first_x, points=4):
+    segment = SharedSegment(12 * points)
+    segment.buf[:12 * points] = struct.pack(f"<{3 * points}f", first_x, *range(1, 3 * points))
+    return segment
+
+
+def test_decode_planes_round_trip():
+    planes = np.zeros(2, dtype=PLANE)
+    planes["normal"] = [(0, 0, 1), (1, 0, 0)]
+    planes["center"] = [(1, 2, 3), (4, 5, 6)]
+    planes["basisU"] = [(1, 0, 0), (0, 1, 0)]
+    planes["basisV"] = [(0, 1, 0), (0, 0, 1)]
+    planes["distanceFromOrigin"] = [0.5, 2.0]
+    planes["inlierCount"] = [10, 20]
+
+    decoded = decode_planes(PLANE_COUNT.pack(2) + planes.tobytes())
+
+    assert decoded == [
+        {"normal": [0.0, 0.0, 1.0], "center": [1.0, 2.0, 3.0], "basisU": [1.0, 0.0, 0.0],
+         "basisV": [0.0, 1.0, 0.0], "distanceFromOrigin": 0.5, "inlierCount": 10},
+        {"normal": [1.0, 0.0, 0.0], "center": [4.0, 5.0, 6.0], "basisU": [0.0, 1.0, 0.0],
+         "basisV": [0.0, 0.0, 1.0], "distanceFromOrigin": 2.0, "inlierCount": 20},
+    ]
+    assert decode_planes(PLANE_COUNT.pack(0)) == []
+
+
+def test_segment_pool_reuses_segments():
+    pool = SegmentPool(max_segments=2)
+    segment = pool.acquire(48)
+    pool.release(segment)
+
+    assert pool.acquire(48) is segment
+    assert pool.acquire(48) is not segment
+    pool.release(segment)
+    pool.close()
+    assert segment.released
+
+
+def test_segment_pool_caps_idle_segments():
+    pool = SegmentPool(max_segments=2)
+    segments = [pool.acquire(48) for _ in range(3)]
+    for segment in segments:
+        pool.release(segment)
+
+    assert [segment.released for segment in segments] == [False, False, True]
+    pool.close()
+
+
+def test_segment_pool_caps_idle_bytes():
+    pool = SegmentPool(max_segments=8, max_bytes=100)
+    large, other, small = pool.acquire(60), pool.acquire(60), pool.acquire(30)
+    for segment in (large, other, small):
+        pool.release(segment)
+
+    assert [large.released, other.released, small.released] == [False, True, False]
+    pool.close()
+
+
+def test_segment_pool_skips_released_segments():
+    pool = SegmentPool(max_segments=2)
+    segment = pool.acquire(48)
+    segment.release()
+    pool.release(segment)
+
+    assert pool.acquire(48) is not segment
+    pool.close()
+
+
+async def test_batch_reports_errors_per_cloud(fake_worker):
+    pool = WorkerPool(fake_worker, 1)
+    await pool.start()
+    segments = [make_segment(1.0), make_segment(math.nan), make_segment(2.0)]
+    try:
+        worker = await pool.acquire()
+        results = await worker.detect_batch(2, 2, DEFAULT_PARAMS, segments)
+        pool.release(worker)
+
+        assert isinstance(results[1], WorkerError)
+        assert str(results[1]) == "bad cloud"
+        for result, x in ((results[0], 1.0), (results[2], 2.0)):
+            [plane] = decode_planes(result)
+            assert plane["center"][0] == x
+            assert plane["distanceFromOrigin"] == 3
+            assert plane["inlierCount"] == 4
+        assert worker.alive
+    finally:
+        for segment in segments:
+            segment.release()
+        await pool.close()
+
+
+async def test_unpackable_request_keeps_worker(fake_worker):
+    pool = WorkerPool(fake_worker, 1)
+    await pool.start()
+    segment = make_segment(1.0)
+    try:
+        worker = await pool.acquire()
+        with pytest.raises(struct.error):
+            await worker.detect(2, 2, (0.0, 0.0, 0.0, 0, -1, 0, 0), segment)
+        assert worker.alive
+        assert decode_planes(await worker.detect(2, 2, DEFAULT_PARAMS, segment))
+        pool.release(worker)
+    finally:
+        segment.release()
+        await pool.close()
+
+
+async def test_pool_respawns_crashed_worker(fake_worker):
+    pool = WorkerPool(fake_worker, 1)
+    await pool.start()
+    crash, segment = make_segment(-1.0), make_segment(1.0)
+    try:
+        worker = await pool.acquire()
+        with pytest.raises(WorkerError, match="exited with code 3"):
+            await worker.detect(2, 2, DEFAULT_PARAMS, crash)
+        assert not worker.alive
+        pool.release(worker)
+
+        replacement = await pool.acquire()
+        assert replacement is not worker
+        assert replacement.alive
+        assert decode_planes(await replacement.detect(2, 2, DEFAULT_PARAMS, segment))
+        pool.release(replacement)
+    finally:
+        crash.release()
+        segment.release()
+        await pool.close()
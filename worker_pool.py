@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import os
+import struct
+import weakref
+from collections import defaultdict
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger("plane_detection_api")
+
+# Request header sent for every batch of same-shape point clouds (see
+# RequestHeader in src/stdin_planes.cpp): width, height, min_normal_diff,
+# max_dist, outlier_ratio, min_num_points, nr_neighbors, max_planes, flags,
+# number of clouds. Parameters whose bit is not set in flags are ignored by
+# the worker, which uses its defaults instead.
+HEADER = struct.Struct("<IIfffIIIII")
+
+# Bits of the header flags
+MIN_NORMAL_DIFF = 1 << 0
+MAX_DIST = 1 << 1
+OUTLIER_RATIO = 1 << 2
+MIN_NUM_POINTS = 1 << 3
+NR_NEIGHBORS = 1 << 4
+MAX_PLANES = 1 << 5
+
+# Each cloud in a batch follows the header as the length of the name of the
+# shared memory segment holding its points, then the name itself. The points
+# themselves are never written to the pipe.
+NAME_LENGTH = struct.Struct("<I")
+
+# Response header sent back by the worker for each cloud of a batch, in
+# order: status, number of payload bytes. A non-zero status means the payload
+# is an error message.
+RESPONSE = struct.Struct("<II")
+
+# Successful payloads are a plane count followed by that many packed plane
+# records (see PlaneRecord in src/stdin_planes.cpp). Field names match the
+# JSON plane keys.
+PLANE_COUNT = struct.Struct("<I")
+PLANE = np.dtype([
+    ("normal", "<f4", 3),
+    ("center", "<f4", 3),
+    ("basisU", "<f4", 3),
+    ("basisV", "<f4", 3),
+    ("distanceFromOrigin", "<f4"),
+    ("inlierCount", "<u4"),
+])
+
+
+def decode_planes(payload):
+    """Decode a worker's binary plane list into a list of JSON-ready dicts."""
+    [count] = PLANE_COUNT.unpack_from(payload)
+    records = np.frombuffer(payload, dtype=PLANE, count=count, offset=PLANE_COUNT.size)
+    columns = [records[name].tolist() for name in PLANE.names]
+    return [dict(zip(PLANE.names, values)) for values in zip(*columns)]
+
+
+class WorkerError(Exception):
+    pass
+
+
+def _release_segment(shm):
+    shm.close()
+    shm.unlink()
+
+
+class SharedSegment:
+    """POSIX shared memory block holding a point cloud for a worker to map.
+
+    The block is unlinked by ``release()``, or when the object is garbage
+    collected if it was never released explicitly.
+    """
+
+    def __init__(self, size):
+        # Zero-sized segments can't be created or mapped
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.size = size
+        self._finalizer = weakref.finalize(self, _release_segment, self.shm)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def buf(self):
+        return self.shm.buf
+
+    @property
+    def released(self):
+        return not self._finalizer.alive
+
+    def release(self):
+        self._finalizer()
+
+
+class SegmentPool:
+    """Free-list of shared memory segments, keyed by size.
+
+    Reusing segments avoids re-allocating (and re-faulting) a full-size
+    buffer for every request, and lets the workers keep them mapped. At most
+    ``max_segments`` idle segments, totalling at most ``max_bytes`` if given,
+    are kept, to cap memory use.
+    """
+
+    def __init__(self, max_segments, max_bytes=None):
+        self.max_segments = max_segments
+        self.max_bytes = max_bytes
+        self._free = defaultdict(list)
+        self._count = 0
+        self._bytes = 0
+
+    def acquire(self, size):
+        free = self._free.get(size)
+        if free:
+            self._count -= 1
+            self._bytes -= size
+            # Most recently used first, as it is the most likely to be hot
+            return free.pop()
+        return SharedSegment(size)
+
+    def release(self, segment):
+        if segment.released:
+            return
+        if self._count >= self.max_segments or (
+            self.max_bytes is not None and self._bytes + segment.size > self.max_bytes
+        ):
+            segment.release()
+            return
+        self._free[segment.size].append(segment)
+        self._count += 1
+        self._bytes += segment.size
+
+    def close(self):
+        for free in self._free.values():
+            for segment in free:
+                segment.release()
+        self._free.clear()
+        self._count = 0
+        self._bytes = 0
+
+
+class Worker:
+    """A long-lived ``stdin_planes --serve`` process."""
+
+    def __init__(self, process, cpus=None):
+        self.process = process
+        self.cpus = cpus
+        self._killed = False
+
+    @classmethod
+    async def spawn(cls, executable_path, quiet=True, cpus=None):
+        # Errors for individual clouds come back in the response, so the
+        # worker's stderr (shared with the server's) only needs its
+        # diagnostics when debugging
+        args = ["--serve", "--quiet"] if quiet else ["--serve"]
+        # The mask is only applied once the process is running, possibly after
+        # OpenMP sized its thread team, so size the team explicitly
+        env = dict(os.environ, OMP_NUM_THREADS=str(len(cpus))) if cpus else None
+        process = await asyncio.create_subprocess_exec(
+            executable_path, *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env=env,
+        )
+        if cpus:
+            # Threads the worker starts later (e.g. for normal estimation)
+            # inherit the mask, so its whole compute stays on these cores
+            os.sched_setaffinity(process.pid, cpus)
+            logger.info(f"Started C++ worker (pid {process.pid}) on CPUs {sorted(cpus)}")
+        else:
+            logger.info(f"Started C++ worker (pid {process.pid})")
+        return cls(process, cpus)
+
+    @property
+    def alive(self):
+        # A killed process keeps returncode None until it is reaped
+        return not self._killed and self.process.returncode is None
+
+    def kill(self):
+        self._killed = True
+        if self.process.returncode is None:
+            self.process.kill()
+
+    async def detect_batch(self, width, height, params, segments):
+        """Run detection on each point cloud in ``segments``.
+
+        Returns a list with, for each cloud, either its binary plane list or
+        the ``WorkerError`` the worker reported for it.
+        """
+        stdin, stdout = self.process.stdin, self.process.stdout
+        # Packed up front, so out-of-range fields fail before anything reaches
+        # the worker
+        request = [HEADER.pack(width, height, *params, len(segments))]
+        for segment in segments:
+            name = segment.name.encode()
+            request.append(NAME_LENGTH.pack(len(name)))
+            request.append(name)
+        results = []
+        try:
+            stdin.write(b"".join(request))
+            await stdin.drain()
+            for _ in segments:
+                status, size = RESPONSE.unpack(await stdout.readexactly(RESPONSE.size))
+                payload = await stdout.readexactly(size)
+                if status != 0:
+                    results.append(WorkerError(payload.decode(errors="replace")))
+                else:
+                    results.append(payload)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            returncode = await self.process.wait()
+            raise WorkerError(f"C++ worker exited with code {returncode}") from e
+        except BaseException:
+            # Interrupted mid-request (e.g. cancelled): the pipes are out of
+            # sync, so the worker can't be reused
+            self.kill()
+            raise
+        return results
+
+    async def detect(self, width, height, params, segment):
+        """Run detection on the point cloud in ``segment`` and return its binary plane list."""
+        [result] = await self.detect_batch(width, height, params, [segment])
+        if isinstance(result, WorkerError):
+            raise result
+        return result
+
+    async def close(self, timeout=5):
+        if not self.alive:
+            # Reap it if it was killed
+            await self.process.wait()
+            return
+        # Closing stdin ends the serve loop
+        self.process.stdin.close()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+
+def partition_cpus(cpus, count):
+    """Split ``cpus`` into ``count`` contiguous, disjoint slices.
+
+    When there are fewer CPUs than slices, slices get one CPU each and wrap
+    around.
+    """
+    cpus = sorted(cpus)
+    if count > len(cpus):
+        return [{cpus[i % len(cpus)]} for i in range(count)]
+    return [set(cpus[i * len(cpus) // count:(i + 1) * len(cpus) // count]) for i in range(count)]
+
+
+class WorkerPool:
+    """Fixed-size pool of C++ workers shared by all requests.
+
+    If ``cpus`` is given, each worker is pinned to its own slice of them, so
+    workers don't migrate between cores or evict each other's caches.
+    """
+
+    def __init__(self, executable_path, size, quiet=True, cpus=None):
+        self.executable_path = executable_path
+        self.size = size
+        self.quiet = quiet
+        self.cpus = cpus
+        self._idle = asyncio.Queue()
+        self._workers = set()
+
+    async def _spawn(self, cpus=None):
+        worker = await Worker.spawn(self.executable_path, quiet=self.quiet, cpus=cpus)
+        self._workers.add(worker)
+        return worker
+
+    async def start(self):
+        slices = partition_cpus(self.cpus, self.size) if self.cpus else [None] * self.size
+        for cpus in slices:
+            self._idle.put_nowait(await self._spawn(cpus))
+        logger.info(f"Worker pool started with {self.size} workers")
+
+    @property
+    def idle(self):
+        """Number of workers currently waiting for work."""
+        return self._idle.qsize()
+
+    async def acquire(self):
+        worker = await self._idle.get()
+        if worker.alive:
+            return worker
+
+        # Replace workers that crashed or were killed since their last use
+        try:
+            returncode = await worker.process.wait()
+            logger.warning(f"C++ worker (pid {worker.process.pid}) exited with code {returncode}, restarting")
+            self._workers.discard(worker)
+            # The replacement takes over the dead worker's CPUs
+            return await self._spawn(worker.cpus)
+        except BaseException:
+            self._idle.put_nowait(worker)
+            raise
+
+    def release(self, worker):
+        self._idle.put_nowait(worker)
+
+    async def close(self):
+        await asyncio.gather(*(worker.close() for worker in self._workers))
+        self._workers.clear()